@@ -5,6 +5,10 @@ This module defines the `IParallelSolver` class, which orchestrates the parallel
 general processing function on a data set consisting of multiple independent data subsets, here reffered to as set IDs.
 It also declares a logging method (intended to start a separate logging thread).
 
+Set IDs are partitioned up front and dispatched to a persistent pool of workers, processes
+or threads depending on the backend, created on the first call to `process_ids` and reused
+by later calls until `close` is called.
+
 Author:
 -------
 Momcilo Tosic
@@ -12,106 +16,325 @@ Astroinformatics student
 Faculty of Mathematics, University of Belgrade
 """
 
-from multiprocessing import Process
-from multiprocessing import Queue
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import sys
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from logging.handlers import QueueHandler, QueueListener
 
 # Default number of processes to spawn
 DEFAULT_NUM_WORKERS = 4
 
+# Number of set ID chunks made per worker, so that workers finishing early take over remaining chunks
+CHUNKS_PER_WORKER = 4
+
+# Workers are forked on Linux, where the pipeline runs, so they inherit the already
+# imported modules; other platforms fall back to spawn, where fork is unsafe or missing
+_ctx = mp.get_context('fork' if sys.platform.startswith('linux') else 'spawn')
+
+# Worker backends accepted by IParallelSolver
+BACKENDS = ('process', 'thread')
+
+# Solver instance bound in each pool worker by `_init_worker`
+_SOLVER = None
+
+class _ForwardedLogHandler(logging.Handler):
+    """
+    Hands log records forwarded from pool workers to the parent's logger of the same name.
+    """
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+
+class _SimpleQueueHandler(QueueHandler):
+    """
+    Sends log records through a multiprocessing SimpleQueue, which has no `put_nowait`.
+    """
+    def enqueue(self, record):
+        self.queue.put(record)
+
+class _SimpleQueueListener(QueueListener):
+    """
+    Reads log records from a multiprocessing SimpleQueue, which has no blocking flag or `put_nowait`.
+    """
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def _init_worker(solver, log_queue, log_level):
+    """
+    Worker initializer, binds the solver to the worker process.
+
+    Solver log records are sent to the parent through `log_queue` instead of
+    being written by each worker.
+
+    Parameters:
+        solver (IParallelSolver): Solver whose processing hooks the worker runs.
+        log_queue (multiprocessing.SimpleQueue): Queue read by the parent's log listener.
+        log_level (int): Effective level of the solver logger in the parent.
+    """
+    global _SOLVER
+    _SOLVER = solver
+
+    log = solver._log
+    log.handlers[:] = [_SimpleQueueHandler(log_queue)]
+    log.setLevel(log_level)
+    log.propagate = False
+
+def _process_chunk(set_ids, save_all, cwd=None, solver=None):
+    """
+    Processes a chunk of set IDs in a pool worker, integrating logging and result handling.
+
+    The chunk is iterated as a local list without synchronization, and the solver hooks
+    are bound to locals once per chunk rather than looked up for every set ID.
+
+    Parameters:
+        set_ids (list of str): Set IDs of the chunk.
+        save_all (bool): Flag to send results back for the unified results file.
+        cwd (str, optional): Working directory of the parent at dispatch time, entered by
+            process workers so per-ID outputs land where the caller expects them.
+        solver (IParallelSolver, optional): Solver to run, given by the thread backend;
+            process workers use the solver bound by `_init_worker`.
+
+    Returns:
+        list: Formatted results of successfully processed set IDs, as returned by
+            `aggregate_process_function_result`, sent to the parent in one batch;
+            empty if `save_all` is not set.
+    """
+    if solver is None:
+        solver = _SOLVER
+    if cwd is not None and cwd != os.getcwd():
+        os.chdir(cwd)
+    begin_logging = solver.maybe_begin_logging
+    get_result = solver.get_process_function_result
+    aggregate = solver.aggregate_process_function_result
+    stop_logging = solver.maybe_stop_logging
+    save_local = solver.maybe_save_local_results
+    log_error = solver._log.error
+
+    local_results = []
+    append_result = local_results.append
+    for set_id in set_ids:
+        # If a throw happens before setting result
+        res = ""
+
+        try:
+            # Maybe start logging
+            begin_logging(set_id)
+
+            # Call main processing function
+            result = get_result(set_id)
+
+            # Get results into formatted string
+            res = aggregate(result)
+        except Exception as e:
+            log_error('Error processing/saving data : %s', e)
+        finally:
+            try:
+                # Maybe stop logging
+                stop_logging()
+
+                # Maybe save local results
+                save_local(set_id, res)
+            except Exception as e:
+                log_error('Error stopping logs : %s', e)
+
+        # Failed set IDs leave nothing to send back
+        if save_all and res:
+            append_result(res)
+
+    return local_results
+
 class IParallelSolver():
     """
     A class to manage parallel execution of data processing functions.
 
+    With the process backend, workers receive a copy of the solver when the pool is created,
+    so configuration changes made after the first `process_ids` call take effect only after
+    `close`; the working directory is the exception, as every call sends the current one
+    to the workers. The thread backend runs the hooks on the solver itself, from several threads at
+    once, so they must be thread-safe; it suits process functions that release the GIL,
+    such as numpy-bound ones, and avoids starting and feeding worker processes.
+    Using the solver as a context manager closes it on exit.
+
     Attributes:
-        num_workers (int): Number of worker processes to spawn.
+        num_workers (int): Number of workers to run.
+        verbose (bool): Flag enabling debug log records of the processing steps. Records go
+            to the logger named after the solver class's module, lowered to DEBUG when set;
+            the caller still configures a handler to show them, e.g. `logging.basicConfig()`.
+        backend (str): Worker backend, 'process' or 'thread'.
     """
     def __init__(self,
                  num_workers = DEFAULT_NUM_WORKERS,
+                 verbose = False,
+                 backend = 'process',
                 ):
         """Initialize the ParallelSolver with the specified configuration."""
 
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+
         self.num_workers = num_workers
+        self.verbose = verbose
+        self.backend = backend
+        # Subclass records, forwarded worker ones included, land under the subclass's module
+        self._log = logging.getLogger(type(self).__module__)
+        if verbose:
+            self._log.setLevel(logging.DEBUG)
+        self._ctx = _ctx
 
-    def process_wrapper(self):
-        """
-        Wrapper for the process function to integrate logging and result handling.
+        # Worker pool and its log forwarding, created lazily by process_ids
+        self._lock = threading.Lock()
+        self._executor = None
+        self._log_queue = None
+        self._log_listener = None
+
+    def process_ids(self, set_ids, results_file = None):
         """
+        Processes a list of set IDs using the configured process function in parallel.
+
+        Parameters:
+            set_ids (list of str): List of set IDs to process.
+            results_file (str, optional): Path to save aggregated results.
 
+        Raises:
+            concurrent.futures.BrokenExecutor: If a worker died while processing; the pool
+                is shut down so that the next call starts a new one.
+        """
 
-        # Event used for stopping background log thread
-        stopper_event = None
+        # Nothing to dispatch, skip starting the pool
+        set_ids = list(set_ids)
+        if not set_ids:
+            self.maybe_save_results(results_file, [])
+            return
 
-        # Go through unprocessed sets
-        while not self.set_ids_.empty():
-            # Safely pop from queue
-            try:
-                set_id = self.set_ids_.get()
-            except Exception as e:
-                break
+        # Partition set IDs round-robin into several chunks per worker; the pool hands
+        # the next chunk to whichever worker is idle, balancing uneven set ID runtimes
+        num_chunks = min(len(set_ids), self.num_workers * CHUNKS_PER_WORKER)
+        chunks = [set_ids[i::num_chunks] for i in range(num_chunks)]
 
-            # If a throw happens before setting result
-            res_string = ""
+        # Send results back only when they are saved to a unified results file
+        save_all = results_file is not None
 
-            try:
-                # Maybe start logging
-                self.maybe_begin_logging(set_id)
+        # Threads share the parent's solver and working directory, process workers get
+        # the current working directory with every chunk
+        if self.backend == 'thread':
+            solver, cwd = self, None
+        else:
+            solver, cwd = None, os.getcwd()
 
-                # Call main processing function
-                result = self.get_process_function_result(set_id)
+        try:
+            # Overlapping calls, e.g. from process_ids_async, must not each start a pool.
+            # A worker dying early breaks the pool already during the submits below
+            with self._lock:
+                self._ensure_executor()
+                futures = [self._executor.submit(_process_chunk, chunk, save_all, cwd, solver) for chunk in chunks]
 
-                # Get results into formatted string
-                res_string = self.aggregate_process_function_result(result)
+            results = (future.result() for future in as_completed(futures))
 
-                # Put results in unified results queue if flag is set
-                if self.save_all_results_:
-                    self.results_.put(res_string)
-            except Exception as e:
-                print('Error processing/saving data : ' + str(e) + '\n')
-            finally:
-                try:
-                    # Maybe stop logging
-                    self.maybe_stop_logging()
+            # Save results to unified results file as worker batches arrive
+            self.maybe_save_results(results_file, results)
 
-                    # Maybe save local results
-                    self.maybe_save_local_results(set_id, res_string)
-                except Exception as e:
-                    print('Error stopping logs : ' + str(e))
+            # Wait for any batches the save hook did not consume, and re-raise worker
+            # failures the hook may have swallowed or never looked at
+            wait(futures)
+            for future in futures:
+                future.result()
+        except BrokenExecutor:
+            # A dead worker breaks the pool, the next call starts a fresh one
+            self.close()
+            raise
 
-    def process_ids(self, set_ids, results_file = None):
+    async def process_ids_async(self, set_ids, results_file = None):
         """
-        Processes a list of set IDs using the configured process function in parallel.
+        Awaitable version of `process_ids`, for callers running an asyncio event loop.
+
+        Dispatching, waiting for workers and writing completed batches run in the loop's
+        default executor, so the event loop stays free while set IDs are processed. Calls
+        on the same solver may overlap, they share its worker pool.
 
         Parameters:
             set_ids (list of str): List of set IDs to process.
             results_file (str, optional): Path to save aggregated results.
         """
+        # Fork the workers here on the loop thread, before the hand-off below starts an
+        # executor thread that a fork would otherwise copy
+        if set_ids:
+            with self._lock:
+                self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.process_ids, set_ids, results_file)
 
+    def _ensure_executor(self):
+        """
+        Starts the worker pool and its log forwarding unless already running. Called with
+        `self._lock` held.
+        """
+        if self._executor is not None:
+            return
+        if self.backend == 'thread':
+            # Threads share the solver and the parent's logging directly
+            self._executor = ThreadPoolExecutor(max_workers = self.num_workers)
+            return
 
-        # Unified output queue and input queue
-        self.results_ = Queue()
-        self.set_ids_ = Queue()
+        # SimpleQueue writes straight to its pipe, without a feeder thread per worker
+        self._log_queue = self._ctx.SimpleQueue()
+        self._executor = ProcessPoolExecutor(max_workers = self.num_workers,
+                                             mp_context = self._ctx,
+                                             initializer = _init_worker,
+                                             initargs = (self, self._log_queue, self._log.getEffectiveLevel()))
+        # The first submit forks the workers, do it now while no pool or listener thread exists
+        self._executor.submit(os.getpid)
+        self._log_listener = _SimpleQueueListener(self._log_queue, _ForwardedLogHandler())
+        self._log_listener.start()
 
-        # Set flag to save all results from unified queue
-        if results_file is not None:
-            self.save_all_results_ = True
-        else:
-            self.save_all_results_ = False
+    def close(self):
+        """
+        Shuts down the worker pool and its log forwarding. A new pool is started by the next
+        `process_ids` call.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait = True)
+                self._executor = None
+            if self._log_listener is not None:
+                self._log_listener.stop()
+                self._log_listener = None
+            self._log_queue = None
+
+    def __enter__(self):
+        return self
 
-        # Fill input queue
-        for id in set_ids:
-            self.set_ids_.put(id)
+    def __exit__(self, *exc):
+        self.close()
 
-        # Generate and start processes
-        processes = [Process(target = self.process_wrapper) for i in range(self.num_workers)]
-        for p in processes:
-          p.start()
-        for p in processes:
-          p.join()
+    def __getstate__(self):
+        """
+        Drops the parent-only pool, lock and log forwarding handles when the solver is sent to a worker.
+        """
+        state = self.__dict__.copy()
+        for key in ('_lock', '_executor', '_log_queue', '_log_listener'):
+            state[key] = None
+        return state
 
-        # Save results to unified results file
-        self.maybe_save_results(results_file)
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
     def aggregate_process_function_result(self, result):
+        """
+        Formats the result of a set ID in the worker.
+
+        Returns:
+            str or bytes: Formatted result, passed to `maybe_save_local_results` and, in
+                batches, to `maybe_save_results`; subclasses may return either type.
+        """
         pass
 
     def get_process_function_result(self, set_id):
@@ -123,8 +346,20 @@ class IParallelSolver():
     def maybe_stop_logging(self):
         pass
 
-    def maybe_save_local_results(self, set_id, res_string):
+    def maybe_save_local_results(self, set_id, res):
+        """
+        Saves the formatted result of a set ID in the worker; `res` is the str or bytes
+        returned by `aggregate_process_function_result`, or an empty str if processing failed.
+        """
         pass
 
-    def maybe_save_results(self, results_file):
+    def maybe_save_results(self, results_file, results):
+        """
+        Saves the results of all set IDs in the parent, called once per `process_ids` call.
+
+        `results` is an iterable yielding one list of str or bytes per worker batch, in
+        completion order rather than set ID order; the lists are empty if `results_file` is
+        None. It may be left unconsumed, `process_ids` then waits for the batches itself,
+        and worker failures are re-raised by `process_ids` even if this hook catches them.
+        """
         pass
@@ -1,6 +1,7 @@
+import os
 import sys
+import threading
 import time
-from multiprocessing import Process, Queue
 from QhX.detection import process1_new  # Fixed mode
 from QhX.dynamical_mode import process1_new_dyn  # Dynamical mode
 from QhX.iparallelization_solver import IParallelSolver
@@ -12,13 +13,53 @@ DEFAULT_PROVIDED_MINFQ = None
 DEFAULT_PROVIDED_MAXFQ = None
 DEFAULT_LOG_PERIOD = 10.0  # Placeholder for log period
 DEFAULT_NUM_WORKERS = 4  # Placeholder for the number of workers
+RESULTS_BUFFER_SIZE = 64 * 1024  # Write buffer of the unified results file, in bytes
+DEFAULT_IOV_MAX = 1024  # Fallback buffer limit of os.writev where the system does not report one
 
 # CSV format results header
 HEADER = "ID,Sampling_1,Sampling_2,Common period (Band1 & Band2),Upper error bound,Lower error bound,Significance,Band1-Band2\n"
 
+def _iov_max():
+    """Returns the system's maximum number of buffers passed to a single os.writev call"""
+    try:
+        iov_max = os.sysconf('SC_IOV_MAX')
+    except (AttributeError, ValueError, OSError):
+        # No sysconf, e.g. on Windows, or no such name on this system
+        return DEFAULT_IOV_MAX
+    # sysconf reports -1 for a limit it cannot determine
+    return iov_max if iov_max > 0 else DEFAULT_IOV_MAX
+
+IOV_MAX = _iov_max()  # Maximum number of buffers passed to a single os.writev call
+
+def _as_bytes(res):
+    """Returns an aggregated result as bytes, encoding it if a subclass returned str"""
+    return res if isinstance(res, bytes) else res.encode()
+
+def _write_buffers(fd, buffers):
+    """
+    Writes a list of bytes buffers to a file descriptor with one os.writev call per IOV_MAX buffers.
+
+    Parameters:
+        fd (int): File descriptor open for writing.
+        buffers (list of bytes): Buffers to write, in order.
+    """
+    for start in range(0, len(buffers), IOV_MAX):
+        iov = buffers[start:start + IOV_MAX]
+        written = os.writev(fd, iov)
+
+        # Finish a short write with plain writes of the remainder, joining only then
+        if written < sum(map(len, iov)):
+            remainder = memoryview(b''.join(iov))[written:]
+            while remainder:
+                remainder = remainder[os.write(fd, remainder):]
+
 class ParallelSolver(IParallelSolver):
     """
     A class to manage parallel execution of data processing functions.
+
+    With the 'thread' backend every worker thread gets its own Logger. Redirecting
+    output to log files swaps sys.stdout for the whole process, so it requires
+    log_files to be disabled.
     """
     def __init__(self,
                  delta_seconds=DEFAULT_LOG_PERIOD,
@@ -33,11 +74,16 @@ class ParallelSolver(IParallelSolver):
                  ngrid=DEFAULT_NGRID,
                  provided_minfq=DEFAULT_PROVIDED_MINFQ,
                  provided_maxfq=DEFAULT_PROVIDED_MAXFQ,
-                 mode='fixed'  # New mode parameter, default to 'fixed'
+                 mode='fixed',  # New mode parameter, default to 'fixed'
+                 verbose=False,
+                 backend='process'
                 ):
         """Initialize the ParallelSolver with the specified configuration."""
-        super().__init__(num_workers)
-        print(f"Initializing ParallelSolver with mode '{mode}' and {num_workers} workers.")
+        super().__init__(num_workers, verbose, backend)
+        if self.backend == 'thread' and log_files:
+            raise ValueError("The 'thread' backend requires log_files=False.")
+        if self.verbose:
+            self._log.debug("Initializing ParallelSolver with mode '%s' and %d workers.", mode, num_workers)
         self.delta_seconds = delta_seconds
         self.data_manager = data_manager
         self.save_results = save_results
@@ -48,30 +94,40 @@ class ParallelSolver(IParallelSolver):
         self.provided_maxfq = provided_maxfq
         self.mode = mode  # Set the mode
         self.logger = Logger(log_files, log_time, delta_seconds)
+        if self.backend == 'thread':
+            # Loggers keep per set ID state, so worker threads cannot share one
+            self._thread_loggers = threading.local()
 
         # Determine the processing function based on the mode
         if self.mode == 'fixed':
             self.process_function = process1_new  # Use the fixed mode function
-            print("Using fixed mode processing function.")
+            if self.verbose:
+                self._log.debug("Using fixed mode processing function.")
         elif self.mode == 'dynamical':
             self.process_function = process1_new_dyn  # Use the dynamical mode function
-            print("Using dynamical mode processing function.")
+            if self.verbose:
+                self._log.debug("Using dynamical mode processing function.")
         else:
             raise ValueError(f"Unknown mode: {self.mode}")
 
     def aggregate_process_function_result(self, result):
-        """Places the result dict into a string"""
-        res = ""
-        print("Aggregating results...")
+        """Places the result dict into encoded CSV rows, ready to be written by the parent"""
+        rows = []
+        if self.verbose:
+            self._log.debug("Aggregating results...")
         for row in result:
             row_values = row.values() if isinstance(row, dict) else row
-            res += ','.join([str(v) for v in row_values]) + "\n"
-        print("Aggregation complete.")
+            rows.append(','.join([str(v) for v in row_values]) + "\n")
+        # Build the string once instead of reallocating it per row, and encode it in the worker
+        res = ''.join(rows).encode()
+        if self.verbose:
+            self._log.debug("Aggregation complete.")
         return res
 
     def get_process_function_result(self, set_id):
         """Run the detection function and return the result based on the mode"""
-        print(f"Processing set ID: {set_id} in mode '{self.mode}'.")
+        if self.verbose:
+            self._log.debug("Processing set ID: %s in mode '%s'.", set_id, self.mode)
 
         if self.mode == 'fixed':
             # Call the fixed mode function
@@ -96,40 +152,73 @@ class ParallelSolver(IParallelSolver):
         else:
             raise ValueError(f"Unknown mode: {self.mode}")
 
-        print(f"Processing for set ID {set_id} in mode '{self.mode}' completed.")
+        if self.verbose:
+            self._log.debug("Processing for set ID %s in mode '%s' completed.", set_id, self.mode)
         return result
 
+    def _worker_logger(self):
+        """Returns the logger of the calling worker, one per thread with the 'thread' backend"""
+        if self.backend != 'thread':
+            return self.logger
+        logger = getattr(self._thread_loggers, 'logger', None)
+        if logger is None:
+            logger = Logger(self.logger.log_files, self.logger.log_time, self.logger.delta_seconds)
+            self._thread_loggers.logger = logger
+        return logger
+
     def maybe_begin_logging(self, set_id):
-        """Starts a logging thread"""
-        print(f"Starting logging for set ID {set_id}")
-        self.logger.start(set_id)
+        """Starts a logging thread, if time or file logging is enabled"""
+        if not (self.logger.log_time or self.logger.log_files):
+            return
+        if self.verbose:
+            self._log.debug("Starting logging for set ID %s", set_id)
+        self._worker_logger().start(set_id)
 
     def maybe_stop_logging(self):
-        """Stops the logger"""
-        print("Stopping logger.")
-        self.logger.stop()
+        """Stops the logger, if time or file logging is enabled"""
+        if not (self.logger.log_time or self.logger.log_files):
+            return
+        if self.verbose:
+            self._log.debug("Stopping logger.")
+        self._worker_logger().stop()
 
-    def maybe_save_local_results(self, set_id, res_string):
-        """Saves local results of set ID formed into a string"""
+    def maybe_save_local_results(self, set_id, res):
+        """Saves local results of set ID formed into CSV rows, given as str or bytes"""
         if self.save_results:
-            print(f"Saving local results for set ID {set_id}")
+            if self.verbose:
+                self._log.debug("Saving local results for set ID %s", set_id)
             try:
-                with open(f'{set_id}-result.csv', 'w') as saving_file:
-                    saving_file.write(HEADER + res_string)
-                print(f"Results saved successfully for set ID {set_id}.")
+                with open(f'{set_id}-result.csv', 'wb') as saving_file:
+                    saving_file.write(HEADER.encode())
+                    # A failed set ID leaves an empty result, saved as the header only
+                    if res:
+                        saving_file.write(_as_bytes(res))
+                if self.verbose:
+                    self._log.debug("Results saved successfully for set ID %s.", set_id)
             except Exception as e:
-                print(f"Error saving results for set ID {set_id}: {e}")
+                self._log.error("Error saving results for set ID %s: %s", set_id, e)
 
-    def maybe_save_results(self, results_file):
-        """If results file is set, saves the full results queue to it."""
+    def maybe_save_results(self, results_file, results):
+        """If results file is set, writes the batches of results to it as workers finish them."""
         if results_file is not None:
-            print(f"Saving all results to {results_file}.")
+            if self.verbose:
+                self._log.debug("Saving all results to %s.", results_file)
             try:
-                with open(results_file, 'w') as f:
-                    f.write(HEADER)
-                    while not self.results_.empty():
-                        result = self.results_.get()
-                        f.write(result)
-                print("All results saved successfully.")
+                if hasattr(os, 'writev'):
+                    # Scatter-gather write, one system call per batch of results
+                    fd = os.open(results_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+                    try:
+                        _write_buffers(fd, [HEADER.encode()])
+                        for chunk_results in results:
+                            _write_buffers(fd, [_as_bytes(res) for res in chunk_results])
+                    finally:
+                        os.close(fd)
+                else:
+                    with open(results_file, 'wb', buffering=RESULTS_BUFFER_SIZE) as f:
+                        f.write(HEADER.encode())
+                        for chunk_results in results:
+                            f.write(b''.join(map(_as_bytes, chunk_results)))
+                if self.verbose:
+                    self._log.debug("All results saved successfully.")
             except Exception as e:
-                print(f"Error while saving to {results_file}: {e}")
+                self._log.error("Error while saving to %s: %s", results_file, e)
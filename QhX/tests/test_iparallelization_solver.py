@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from unittest import mock
+from QhX.iparallelization_solver import IParallelSolver
+
+class SquareSolver(IParallelSolver):
+    """Minimal solver squaring integer set IDs, shifted by a configurable offset."""
+
+    def __init__(self, num_workers=2, backend='process', offset=0, verbose=False):
+        super().__init__(num_workers, verbose, backend)
+        self.offset = offset
+
+    def get_process_function_result(self, set_id):
+        if self.verbose:
+            self._log.debug("Squaring set ID %s", set_id)
+        # Simulates a worker killed mid-chunk, e.g. by the OOM killer
+        if set_id == 'die':
+            os._exit(1)
+        return int(set_id) ** 2 + self.offset
+
+    def aggregate_process_function_result(self, result):
+        return f'{result}\n'
+
+    def maybe_save_local_results(self, set_id, res):
+        if res:
+            with open(f'{set_id}-local.txt', 'w') as f:
+                f.write(res)
+
+    def maybe_save_results(self, results_file, results):
+        if results_file is not None:
+            with open(results_file, 'w') as f:
+                for chunk_results in results:
+                    f.write(''.join(chunk_results))
+
+def read_results(results_file):
+    with open(results_file) as f:
+        return sorted(int(line) for line in f)
+
+class TestIParallelSolver(unittest.TestCase):
+
+    def setUp(self):
+        # Run every test in its own scratch directory
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        self.solver = SquareSolver()
+
+    def tearDown(self):
+        self.solver.close()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_workers_follow_working_directory(self):
+        # The pool outlives the first call, later calls must still write where the caller is
+        os.mkdir('b0')
+        os.mkdir('b1')
+        os.chdir('b0')
+        self.solver.process_ids(['2'])
+        os.chdir(os.path.join('..', 'b1'))
+        self.solver.process_ids(['3'])
+        os.chdir('..')
+
+        self.assertTrue(os.path.isfile(os.path.join('b0', '2-local.txt')))
+        self.assertTrue(os.path.isfile(os.path.join('b1', '3-local.txt')))
+        self.assertFalse(os.path.isfile(os.path.join('b0', '3-local.txt')))
+
+    def test_configuration_snapshot_until_close(self):
+        self.solver.process_ids(['2'], 'first.csv')
+        self.assertEqual(read_results('first.csv'), [4])
+
+        # Workers keep the solver they were started with
+        self.solver.offset = 10
+        self.solver.process_ids(['2'], 'second.csv')
+        self.assertEqual(read_results('second.csv'), [4])
+
+        # Closing restarts the workers with the current configuration
+        self.solver.close()
+        self.solver.process_ids(['2'], 'third.csv')
+        self.assertEqual(read_results('third.csv'), [14])
+
+    def test_dead_worker_raises_and_resets_pool(self):
+        for results_file in (None, 'results.csv'):
+            with self.assertRaises(BrokenExecutor):
+                self.solver.process_ids(['die', '2'], results_file)
+            self.assertIsNone(self.solver._executor)
+
+            # The next call runs on a fresh pool
+            self.solver.process_ids(['2', '3'], 'after.csv')
+            self.assertEqual(read_results('after.csv'), [4, 9])
+
+    def test_pool_broken_at_submit_resets_pool(self):
+        self.solver.process_ids(['2'])
+        with mock.patch.object(self.solver._executor, 'submit', side_effect=BrokenExecutor):
+            with self.assertRaises(BrokenExecutor):
+                self.solver.process_ids(['2', '3'])
+        self.assertIsNone(self.solver._executor)
+
+    def test_empty_set_ids_skip_pool(self):
+        self.solver.process_ids([], 'empty.csv')
+        self.assertIsNone(self.solver._executor)
+        self.assertEqual(read_results('empty.csv'), [])
+
+    def test_context_manager_closes_pool(self):
+        with SquareSolver() as solver:
+            solver.process_ids(['2'], 'results.csv')
+            self.assertIsNotNone(solver._executor)
+        self.assertIsNone(solver._executor)
+        self.assertIsNone(solver._log_listener)
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertEqual(read_results('results.csv'), [4])
+
+    def test_overlapping_async_calls_share_one_pool(self):
+        async def run_both():
+            await asyncio.gather(self.solver.process_ids_async(['1', '2'], 'first.csv'),
+                                 self.solver.process_ids_async(['3', '4'], 'second.csv'))
+
+        # Slow pool creation down so that both calls reach it before either finishes
+        def slow_executor(*args, **kwargs):
+            time.sleep(0.2)
+            return ProcessPoolExecutor(*args, **kwargs)
+
+        with mock.patch('QhX.iparallelization_solver.ProcessPoolExecutor', side_effect=slow_executor) as factory:
+            asyncio.run(run_both())
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(read_results('first.csv'), [1, 4])
+        self.assertEqual(read_results('second.csv'), [9, 16])
+        self.assertEqual(len(multiprocessing.active_children()), self.solver.num_workers)
+
+    def test_async_call_forks_before_starting_threads(self):
+        # Python 3.12+ warns that forking a multi-threaded process may deadlock the child
+        fork = os.fork
+        threads_at_fork = []
+
+        def counting_fork():
+            threads_at_fork.append(threading.active_count())
+            return fork()
+
+        with warnings.catch_warnings(record=True) as caught, \
+                mock.patch('os.fork', side_effect=counting_fork):
+            warnings.simplefilter('always', DeprecationWarning)
+            asyncio.run(self.solver.process_ids_async(['1', '2'], 'results.csv'))
+
+        self.assertEqual(threads_at_fork, [1] * self.solver.num_workers)
+        self.assertFalse([w for w in caught if issubclass(w.category, DeprecationWarning)])
+        self.assertEqual(read_results('results.csv'), [1, 4])
+
+    def test_verbose_logs_under_subclass_module(self):
+        # Closing the solver drains the forwarded worker records before the logs are checked
+        with self.assertLogs(__name__, logging.DEBUG) as logs, SquareSolver(verbose=True) as solver:
+            solver.process_ids(['2'])
+        self.assertIn("Squaring set ID 2", logs.output[0])
+
+    def test_thread_backend(self):
+        with SquareSolver(backend='thread') as solver:
+            solver.process_ids(['2', '3'], 'results.csv')
+        self.assertEqual(read_results('results.csv'), [4, 9])
+        self.assertTrue(os.path.isfile('3-local.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
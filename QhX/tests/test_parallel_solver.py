@@ -1,14 +1,49 @@
 import os
-import gc
-import threading
+import tempfile
+from unittest import mock
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import unittest
-from QhX.parallelization_solver import ParallelSolver
+from QhX.parallelization_solver import DEFAULT_IOV_MAX, HEADER, ParallelSolver, _iov_max, _write_buffers
 from QhX import DataManagerDynamical, process1_new_dyn
 
+# Expected columns of the results file
+EXPECTED_COLUMNS = [
+    "ID", "Sampling_1", "Sampling_2", "Common period (Band1 & Band2)",
+    "Upper error bound", "Lower error bound", "Significance", "Band1-Band2"
+]
+
+def create_synthetic_data():
+    np.random.seed(42)
+    object_id = '1'
+    num_measurements = 50
+    mjd_values = np.linspace(50000, 50500, num=num_measurements)
+    psMag_values = np.random.normal(loc=20.0, scale=0.5, size=num_measurements)
+    psMagErr_values = np.random.uniform(0.02, 0.1, size=num_measurements)
+    filter_values = np.tile([0, 1, 2, 3], int(num_measurements / 4) + 1)[:num_measurements]
+    data = {
+        'objectId': [object_id] * num_measurements,
+        'mjd': mjd_values,
+        'psMag': psMag_values,
+        'psMagErr': psMagErr_values,
+        'filter': filter_values
+    }
+    return pa.Table.from_pydict(data)
+
 class TestParallelSolver(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Write the synthetic data once for all tests
+        cls.synthetic_data_file = 'synthetic_test_data.parquet'
+        pq.write_table(create_synthetic_data(), cls.synthetic_data_file, compression=None)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.isfile(cls.synthetic_data_file):
+            os.remove(cls.synthetic_data_file)
+
     def setUp(self):
         print("Running setUp...")  # Debugging print
         agn_dc_mapping = {
@@ -21,9 +56,6 @@ class TestParallelSolver(unittest.TestCase):
             group_by_key=agn_dc_mapping['group_by_key'],
             filter_mapping=agn_dc_mapping['filter_mapping']
         )
-        self.synthetic_data = self.create_synthetic_data()
-        self.synthetic_data_file = 'synthetic_test_data.parquet'
-        self.synthetic_data.to_parquet(self.synthetic_data_file)
         self.data_manager.load_data(self.synthetic_data_file)
         self.data_manager.group_data()
         self.solver = ParallelSolver(
@@ -43,27 +75,12 @@ class TestParallelSolver(unittest.TestCase):
         )
         self.setids = ['1']
 
-    def create_synthetic_data(self):
-        np.random.seed(42)
-        object_id = '1'
-        num_measurements = 50
-        mjd_values = np.linspace(50000, 50500, num=num_measurements)
-        psMag_values = np.random.normal(loc=20.0, scale=0.5, size=num_measurements)
-        psMagErr_values = np.random.uniform(0.02, 0.1, size=num_measurements)
-        filter_values = np.tile([0, 1, 2, 3], int(num_measurements / 4) + 1)[:num_measurements]
-        data = {
-            'objectId': [object_id] * num_measurements,
-            'mjd': mjd_values,
-            'psMag': psMag_values,
-            'psMagErr': psMagErr_values,
-            'filter': filter_values
-        }
-        return pd.DataFrame(data)
-
     def test_parallel_solver_process_and_merge(self):
         print("Running test_parallel_solver_process_and_merge...")  # Debugging print
         try:
-            self.solver.process_ids(set_ids=self.setids, results_file='1-reslut.csv')
+            # Leaving the block shuts the worker pool down
+            with self.solver as solver:
+                solver.process_ids(set_ids=self.setids, results_file='1-reslut.csv')
             print("Solver processed IDs successfully.")  # Debugging print
         except Exception as e:
             self.fail(f"Error processing/saving data: {e}")
@@ -71,43 +88,135 @@ class TestParallelSolver(unittest.TestCase):
         if not os.path.exists('1-reslut.csv'):
             self.fail("Processed result file missing or cannot be read")
 
-        # Read the processing result and check structure
-        actual_df = pd.read_csv('1-reslut.csv')
-        print("Actual DataFrame read successfully.")  # Debugging print
+        # Read the processing result once and check structure
+        with open('1-reslut.csv') as f:
+            contents = f.read()
+        header = contents.splitlines()[0].split(',')
+        self.assertListEqual(header, EXPECTED_COLUMNS)
 
-        # Check that the DataFrame has the expected columns
-        expected_columns = [
-            "ID", "Sampling_1", "Sampling_2", "Common period (Band1 & Band2)",
-            "Upper error bound", "Lower error bound", "Significance", "Band1-Band2"
-        ]
-        self.assertListEqual(list(actual_df.columns), expected_columns)
+        # Parse only the numeric columns that are checked
+        usecols = [EXPECTED_COLUMNS.index(c) for c in ("Sampling_1", "Sampling_2", "Significance")]
+        values = np.atleast_2d(np.genfromtxt('1-reslut.csv', delimiter=',', skip_header=1, usecols=usecols))
+        sampling_1, sampling_2, significance = values.T
 
         # Optional: Check if numerical values fall within expected ranges
-        self.assertTrue((actual_df["Sampling_1"] > 0).all())
-        self.assertTrue((actual_df["Sampling_2"] > 0).all())
-        self.assertTrue((actual_df["Significance"].fillna(0) >= 0).all())  # Allow NaN, otherwise check non-negative
+        self.assertTrue((sampling_1 > 0).all())
+        self.assertTrue((sampling_2 > 0).all())
+        self.assertTrue((np.nan_to_num(significance, nan=0.0) >= 0).all())  # Allow NaN, otherwise check non-negative
 
-        # Print the result DataFrame for inspection
+        # Print the results file for inspection
         print("\nContents of 1-reslut.csv:")
-        print(actual_df.to_string(index=False))  # Print DataFrame without row indices
-    
+        print(contents)
+
+    def run_thread_backend(self, log_time):
+        solver = ParallelSolver(
+            delta_seconds=12.0,
+            num_workers=2,
+            data_manager=self.data_manager,
+            log_time=log_time,
+            save_results=True,
+            ntau=80,
+            ngrid=100,
+            provided_minfq=500,
+            provided_maxfq=10,
+            mode='dynamical',
+            backend='thread'
+        )
+        old_cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                with solver:
+                    solver.process_ids(set_ids=self.setids, results_file='results.csv')
+
+                # Per-ID results are saved next to the unified results file
+                self.assertTrue(os.path.isfile('1-result.csv'))
+                with open('results.csv') as f:
+                    self.assertListEqual(f.readline().rstrip('\n').split(','), EXPECTED_COLUMNS)
+            finally:
+                os.chdir(old_cwd)
+
+    def test_thread_backend_with_time_logging(self):
+        self.run_thread_backend(log_time=True)
+
+    def test_thread_backend_without_logging(self):
+        self.run_thread_backend(log_time=False)
+
+    def test_thread_backend_rejects_log_files(self):
+        with self.assertRaises(ValueError):
+            ParallelSolver(log_files=True, backend='thread')
 
     def tearDown(self):
         print("Cleaning up...")  # Debugging print
-        if hasattr(self.solver, 'executor') and self.solver.executor:
-            try:
-                self.solver.executor.shutdown(wait=True)
-                print("Executor shutdown successfully.")  # Debugging print
-            except Exception as e:
-                print(f"Error during executor shutdown: {e}")
-        if os.path.isfile(self.synthetic_data_file):
-            os.remove(self.synthetic_data_file)
+        self.solver.close()
         if os.path.isfile('1-reslut.csv'):
             os.remove('1-reslut.csv')
-        gc.collect()
-        for thread in threading.enumerate():
-            if thread.name != "MainThread":
-                print(f"Thread {thread.name} is still active.")  # Debugging print
+
+class TestResultTypes(unittest.TestCase):
+    """Aggregated results may be str, from overriding subclasses, or bytes."""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        self.solver = ParallelSolver(log_time=False)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_unified_results_accept_str_and_bytes(self):
+        self.solver.maybe_save_results('results.csv', iter([['a,1\n'], [b'b,2\n', 'c,3\n']]))
+        with open('results.csv') as f:
+            self.assertEqual(f.read(), HEADER + 'a,1\nb,2\nc,3\n')
+
+    def test_local_results_accept_str_and_bytes(self):
+        self.solver.maybe_save_local_results('s', 'a,1\n')
+        self.solver.maybe_save_local_results('b', b'b,2\n')
+        with open('s-result.csv') as f:
+            self.assertEqual(f.read(), HEADER + 'a,1\n')
+        with open('b-result.csv') as f:
+            self.assertEqual(f.read(), HEADER + 'b,2\n')
+
+@unittest.skipUnless(hasattr(os, 'writev'), "os.writev is not available")
+class TestWriteBuffers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'out.csv')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, buffers):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            _write_buffers(fd, buffers)
+        finally:
+            os.close(fd)
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_full_write(self):
+        self.assertEqual(self.write([b'a,1\n', b'b,2\n']), b'a,1\nb,2\n')
+
+    def test_short_write_finishes_remainder(self):
+        real_write = os.write
+
+        # writev that stops two bytes into the first buffer
+        def short_writev(fd, iov):
+            return real_write(fd, iov[0][:2])
+
+        with mock.patch('os.writev', side_effect=short_writev):
+            self.assertEqual(self.write([b'a,1\n', b'b,2\n', b'c,3\n']), b'a,1\nb,2\nc,3\n')
+
+    def test_iov_max_from_system(self):
+        with mock.patch('os.sysconf', return_value=16):
+            self.assertEqual(_iov_max(), 16)
+        # Indeterminate or unknown limits fall back to the default
+        with mock.patch('os.sysconf', return_value=-1):
+            self.assertEqual(_iov_max(), DEFAULT_IOV_MAX)
+        with mock.patch('os.sysconf', side_effect=ValueError):
+            self.assertEqual(_iov_max(), DEFAULT_IOV_MAX)
 
 if __name__ == '__main__':
     unittest.main()